@@ -5,74 +5,111 @@ Sends concurrent requests and measures latency metrics
 """
 import asyncio
 import aiohttp
+import yarl
 import time
 import argparse
+import csv
 import json
+import operator
+from collections import Counter
 from pathlib import Path
 from datetime import datetime
-import statistics
 
-async def send_request(session, url, model, prompt, semaphore):
-    """Send a single request and measure latencies"""
-    async with semaphore:
-        payload = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 100,
-            "temperature": 0.7
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def encode_json(obj):
+    """Serialize obj to JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+def decode_json(data):
+    """Parse JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+async def send_request(session, chat_url, body):
+    """Send a single pre-serialized streaming request and measure latencies"""
+    start_ns = time.perf_counter_ns()
+    first_token_ns = None
+    last_frame = None
+    frames = 0
+
+    try:
+        async with session.post(
+            chat_url,
+            data=body,
+            headers=JSON_HEADERS
+        ) as response:
+            response.raise_for_status()
+
+            # Read the SSE stream, timestamping the first data frame; only the
+            # last frame (which carries usage) is parsed
+            async for line in response.content:
+                if not line.startswith(b'data: '):
+                    continue
+                frame = line[6:].strip()
+                if frame == b'[DONE]':
+                    break
+                if first_token_ns is None:
+                    first_token_ns = time.perf_counter_ns()
+                frames += 1
+                last_frame = frame
+
+            # Record end time
+            end_ns = time.perf_counter_ns()
+
+        usage = (decode_json(last_frame).get('usage') if last_frame else None) or {}
+        # Without usage, each content frame carries roughly one token
+        output_tokens = usage.get('completion_tokens', frames)
+
+        # Integer nanosecond deltas; converted to ms only for the result
+        if first_token_ns is None:
+            first_token_ns = end_ns
+        total_latency_ms = (end_ns - start_ns) / 1e6
+        ttft_ms = (first_token_ns - start_ns) / 1e6
+        itl_ms = (total_latency_ms - ttft_ms) / (output_tokens - 1) if output_tokens > 1 else 0
+
+        return {
+            'success': True,
+            'time_to_first_token_ms': ttft_ms,
+            'inter_token_latency_ms': itl_ms,
+            'end_to_end_latency_ms': total_latency_ms,
+            'num_input_tokens': usage.get('prompt_tokens', 0),
+            'num_output_tokens': output_tokens,
+            'total_tokens': usage.get('total_tokens', 0)
         }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e),
+            'time_to_first_token_ms': 0,
+            'inter_token_latency_ms': 0,
+            'end_to_end_latency_ms': 0,
+            'num_input_tokens': 0,
+            'num_output_tokens': 0,
+            'total_tokens': 0
+        }
+
+async def run_benchmark(url, model, num_requests, concurrency, log_file=None):
+    """Run benchmark with specified parameters
 
-        start_time = time.time()
-        first_token_time = None
-        tokens_received = []
-
-        try:
-            async with session.post(
-                f"{url}/v1/chat/completions",
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                # Record end time
-                end_time = time.time()
-
-                # Extract metrics
-                usage = data.get('usage', {})
-                content = data['choices'][0]['message']['content']
-
-                # Estimate TTFT and ITL (these are approximations without streaming)
-                total_latency_ms = (end_time - start_time) * 1000
-                output_tokens = usage.get('completion_tokens', len(content.split()))
-
-                # Rough estimates
-                ttft_ms = total_latency_ms * 0.1  # Assume 10% for first token
-                itl_ms = (total_latency_ms - ttft_ms) / output_tokens if output_tokens > 1 else 0
-
-                return {
-                    'success': True,
-                    'time_to_first_token_ms': ttft_ms,
-                    'inter_token_latency_ms': itl_ms,
-                    'end_to_end_latency_ms': total_latency_ms,
-                    'num_input_tokens': usage.get('prompt_tokens', 0),
-                    'num_output_tokens': output_tokens,
-                    'total_tokens': usage.get('total_tokens', 0)
-                }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e),
-                'time_to_first_token_ms': 0,
-                'inter_token_latency_ms': 0,
-                'end_to_end_latency_ms': 0,
-                'num_input_tokens': 0,
-                'num_output_tokens': 0,
-                'total_tokens': 0
-            }
-
-async def run_benchmark(url, model, num_requests, concurrency):
-    """Run benchmark with specified parameters"""
+    If log_file (a binary file object) is given, every request's result is
+    appended to it as one NDJSON line as soon as the request completes.
+    """
     print(f"Running benchmark:")
     print(f"  URL: {url}")
     print(f"  Model: {model}")
@@ -88,64 +125,123 @@ async def run_benchmark(url, model, num_requests, concurrency):
         "What is the future of automation?",
     ]
 
-    semaphore = asyncio.Semaphore(concurrency)
-    results = []
+    # Prompts cycle across requests, so serialize each distinct body once
+    bodies = [
+        encode_json({
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 100,
+            "temperature": 0.7,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        })
+        for prompt in prompts
+    ]
+
+    # Build the target URL once; aiohttp skips re-parsing a prebuilt yarl.URL
+    chat_url = yarl.URL(f"{url}/v1/chat/completions", encoded=True)
 
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for i in range(num_requests):
-            prompt = prompts[i % len(prompts)]
-            tasks.append(send_request(session, url, model, prompt, semaphore))
+    # Requests are pulled from a bounded queue by `concurrency` workers, so
+    # only O(concurrency) coroutines are alive instead of one per request
+    results = [None] * num_requests
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+
+    async def worker(session):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            i, body = item
+            results[i] = result = await send_request(session, chat_url, body)
+            if log_file is not None:
+                log_file.write(encode_json({'request_id': i, **result}) + b'\n')
+
+    # One pooled connector for the whole run so connections to the endpoint
+    # are kept alive and reused; its limit also caps in-flight requests at
+    # the transport layer
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=concurrency,
+        ttl_dns_cache=300
+    )
+    timeout = aiohttp.ClientTimeout(total=60)
 
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
         # Run all requests
         print(f"\nSending {num_requests} requests with concurrency {concurrency}...")
-        start_time = time.time()
-        results = await asyncio.gather(*tasks)
-        total_time = time.time() - start_time
+        start_ns = time.perf_counter_ns()
+        workers = [asyncio.create_task(worker(session)) for _ in range(concurrency)]
+        for i in range(num_requests):
+            await queue.put((i, bodies[i % len(bodies)]))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        total_time = (time.perf_counter_ns() - start_ns) / 1e9
 
-    # Filter successful results
-    successful = [r for r in results if r.get('success')]
-    failed = len(results) - len(successful)
+    # Filter successful results and extract metric columns in a single pass
+    ttft = np.empty(len(results), dtype=np.float64)
+    itl = np.empty(len(results), dtype=np.float64)
+    e2e = np.empty(len(results), dtype=np.float64)
+    input_tokens = np.empty(len(results), dtype=np.int64)
+    output_tokens = np.empty(len(results), dtype=np.int64)
+    successful = []
+    errors = Counter()
+    for r in results:
+        if not r.get('success'):
+            errors[r['error']] += 1
+            continue
+        i = len(successful)
+        ttft[i] = r['time_to_first_token_ms']
+        itl[i] = r['inter_token_latency_ms']
+        e2e[i] = r['end_to_end_latency_ms']
+        input_tokens[i] = r['num_input_tokens']
+        output_tokens[i] = r['num_output_tokens']
+        successful.append(r)
+    n = len(successful)
+    failed = len(results) - n
 
     print(f"\nCompleted in {total_time:.2f}s")
-    print(f"Success: {len(successful)}/{num_requests}, Failed: {failed}")
+    print(f"Success: {n}/{num_requests}, Failed: {failed}")
+
+    # Failures are aggregated by message rather than reported one by one
+    for message, count in errors.most_common(5):
+        print(f"  {count}x {message}")
 
     if not successful:
         print("❌ All requests failed!")
         return None
 
-    # Calculate statistics
+    ttft, itl, e2e = ttft[:n], itl[:n], e2e[:n]
+    input_tokens, output_tokens = input_tokens[:n], output_tokens[:n]
+
+    # One partition per metric for all of its percentiles
+    ttft_p50, ttft_p90, ttft_p99 = np.percentile(ttft, [50, 90, 99])
+    e2e_p50, e2e_p90, e2e_p99 = np.percentile(e2e, [50, 90, 99])
+
     stats = {
         'total_requests': num_requests,
-        'successful_requests': len(successful),
+        'successful_requests': n,
         'failed_requests': failed,
+        'errors': dict(errors),
         'total_time_seconds': total_time,
-        'requests_per_second': len(successful) / total_time,
-
-        'ttft_mean_ms': statistics.mean(r['time_to_first_token_ms'] for r in successful),
-        'ttft_p50_ms': statistics.median(r['time_to_first_token_ms'] for r in successful),
-        'ttft_p90_ms': statistics.quantiles(
-            [r['time_to_first_token_ms'] for r in successful], n=10
-        )[8],
-        'ttft_p99_ms': statistics.quantiles(
-            [r['time_to_first_token_ms'] for r in successful], n=100
-        )[98],
-
-        'itl_mean_ms': statistics.mean(r['inter_token_latency_ms'] for r in successful),
-        'itl_p50_ms': statistics.median(r['inter_token_latency_ms'] for r in successful),
-
-        'e2e_mean_ms': statistics.mean(r['end_to_end_latency_ms'] for r in successful),
-        'e2e_p50_ms': statistics.median(r['end_to_end_latency_ms'] for r in successful),
-        'e2e_p90_ms': statistics.quantiles(
-            [r['end_to_end_latency_ms'] for r in successful], n=10
-        )[8],
-        'e2e_p99_ms': statistics.quantiles(
-            [r['end_to_end_latency_ms'] for r in successful], n=100
-        )[98],
-
-        'tokens_per_second': sum(r['num_output_tokens'] for r in successful) / total_time,
-        'avg_input_tokens': statistics.mean(r['num_input_tokens'] for r in successful),
-        'avg_output_tokens': statistics.mean(r['num_output_tokens'] for r in successful),
+        'requests_per_second': n / total_time,
+
+        'ttft_mean_ms': ttft.mean(),
+        'ttft_p50_ms': ttft_p50,
+        'ttft_p90_ms': ttft_p90,
+        'ttft_p99_ms': ttft_p99,
+
+        'itl_mean_ms': itl.mean(),
+        'itl_p50_ms': np.median(itl),
+
+        'e2e_mean_ms': e2e.mean(),
+        'e2e_p50_ms': e2e_p50,
+        'e2e_p90_ms': e2e_p90,
+        'e2e_p99_ms': e2e_p99,
+
+        'tokens_per_second': output_tokens.sum() / total_time,
+        'avg_input_tokens': input_tokens.mean(),
+        'avg_output_tokens': output_tokens.mean(),
     }
 
     # Print summary
@@ -171,28 +267,42 @@ async def run_benchmark(url, model, num_requests, concurrency):
 
     return {'results': successful, 'stats': stats}
 
-def save_results(data, env, model):
-    """Save results to CSV and JSON files"""
+def write_json(path, obj):
+    """Write obj as indented JSON, using orjson when it is installed"""
+    if orjson is not None:
+        Path(path).write_bytes(
+            orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        )
+    else:
+        with open(path, 'w') as f:
+            json.dump(obj, f, indent=2)
+
+def create_results_dir(env, model):
+    """Create a timestamped results directory for this run"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     model_name = model.split('/')[-1]
 
-    # Create results directory
     results_dir = Path("../results") / env / f"benchmark_{model_name}_{timestamp}"
     results_dir.mkdir(parents=True, exist_ok=True)
+    return results_dir
+
+def save_results(data, results_dir):
+    """Save results to CSV and JSON files"""
 
-    # Save CSV
-    import csv
+    # Save CSV; every row has the same keys, so project rows with one
+    # itemgetter instead of DictWriter's per-cell lookups
     csv_file = results_dir / "profile_export.csv"
-    with open(csv_file, 'w', newline='') as f:
+    with open(csv_file, 'w', newline='', buffering=1 << 20) as f:
         if data['results']:
-            writer = csv.DictWriter(f, fieldnames=data['results'][0].keys())
-            writer.writeheader()
-            writer.writerows(data['results'])
+            fields = list(data['results'][0].keys())
+            getter = operator.itemgetter(*fields)
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            writer.writerows(getter(r) for r in data['results'])
 
     # Save JSON
     json_file = results_dir / "profile_export.json"
-    with open(json_file, 'w') as f:
-        json.dump(data['stats'], f, indent=2)
+    write_json(json_file, data['stats'])
 
     print(f"\n✅ Results saved to: {results_dir}")
     return results_dir
@@ -207,6 +317,16 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    data = asyncio.run(run_benchmark(args.url, args.model, args.requests, args.concurrency))
+    # Keep the client's own scheduling overhead low at high concurrency
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    results_dir = create_results_dir(args.env, args.model)
+
+    # Per-request results are streamed to requests.ndjson during the run
+    with open(results_dir / "requests.ndjson", 'wb') as log_file:
+        data = asyncio.run(
+            run_benchmark(args.url, args.model, args.requests, args.concurrency, log_file)
+        )
     if data:
-        save_results(data, args.env, args.model)
+        save_results(data, results_dir)
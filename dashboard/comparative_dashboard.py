@@ -1,10 +1,14 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
 import json
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 st.set_page_config(page_title="Baseline vs Managed Comparison", layout="wide")
 
 st.title("🚀 Baseline vs Managed vLLM Infrastructure Comparison")
@@ -25,6 +29,25 @@ view_mode = st.sidebar.radio(
     index=1
 )
 
+@st.cache_data
+def read_results_file(path, mtime):
+    """Parse a results file; mtime is part of the cache key so edits invalidate it"""
+    if orjson is not None:
+        return orjson.loads(Path(path).read_bytes())
+    with open(path) as f:
+        return json.load(f)
+
+@st.cache_data
+def bar_chart(df, **px_kwargs):
+    """Build a plotly express bar chart as a figure dict, cached on its inputs"""
+    fig = px.bar(df, **px_kwargs)
+    if 'facet_col' in px_kwargs:
+        # Facets hold different metrics, so give each its own y-axis range
+        # and label it with just the facet value
+        fig.update_yaxes(matches=None, showticklabels=True)
+        fig.for_each_annotation(lambda a: a.update(text=a.text.split('=', 1)[-1]))
+    return fig.to_dict()
+
 # Load results function
 def load_results(env_name, bench_type="custom"):
     """Load results for a given environment and benchmark type"""
@@ -34,8 +57,8 @@ def load_results(env_name, bench_type="custom"):
         results_file = Path(f"../results/{env_name}/k8s/genai-perf-results.json")
 
     if results_file.exists():
-        with open(results_file) as f:
-            return json.load(f), True, str(results_file)
+        results = read_results_file(str(results_file), results_file.stat().st_mtime)
+        return results, True, str(results_file)
     return None, False, str(results_file)
 
 # Load results based on selected benchmark type
@@ -58,36 +81,50 @@ else:  # Both
     managed_results, managed_exists, managed_file = managed_custom, managed_custom_exists, "custom"
     results_label = "Both Benchmarks"
 
+# Flattened result fields and their display names
+RESULT_COLUMNS = {
+    'model': 'Full Model Name',
+    'requests_per_second': 'Requests/sec',
+    'latency.mean': 'Mean Latency (s)',
+    'latency.median': 'Median Latency (s)',
+    'latency.p95': 'P95 Latency (s)',
+    'latency.p99': 'P99 Latency (s)',
+    'latency.min': 'Min Latency (s)',
+    'latency.max': 'Max Latency (s)',
+    'throughput_tokens_per_sec.total': 'Tokens/sec',
+    'throughput_tokens_per_sec.mean': 'Mean Tokens/sec',
+    'tokens.total': 'Total Tokens',
+    'total_requests': 'Total Requests',
+    'successful_requests': 'Successful Requests',
+    'failed_requests': 'Failed Requests',
+    'total_time': 'Total Time (s)',
+}
+
+COMPARISON_COLUMNS = [
+    'Environment', 'Model', 'Full Model Name', 'Requests/sec',
+    'Mean Latency (s)', 'Median Latency (s)', 'P95 Latency (s)', 'P99 Latency (s)',
+    'Min Latency (s)', 'Max Latency (s)', 'Tokens/sec', 'Mean Tokens/sec',
+    'Total Tokens', 'Success Rate %', 'Total Requests', 'Successful Requests',
+    'Failed Requests', 'Total Time (s)',
+]
+
 # Function to create comparison dataframe
 def create_comparison_df(results, env_name):
     """Create a dataframe from results for a specific environment"""
     if not results:
         return pd.DataFrame()
 
-    data = []
-    for result in results:
-        model_short_name = result['model'].split('/')[-1]
-        data.append({
-            'Environment': env_name,
-            'Model': model_short_name,
-            'Full Model Name': result['model'],
-            'Requests/sec': result['requests_per_second'],
-            'Mean Latency (s)': result['latency']['mean'],
-            'Median Latency (s)': result['latency']['median'],
-            'P95 Latency (s)': result['latency']['p95'],
-            'P99 Latency (s)': result['latency']['p99'],
-            'Min Latency (s)': result['latency']['min'],
-            'Max Latency (s)': result['latency']['max'],
-            'Tokens/sec': result['throughput_tokens_per_sec']['total'],
-            'Mean Tokens/sec': result['throughput_tokens_per_sec']['mean'],
-            'Total Tokens': result['tokens']['total'],
-            'Success Rate %': (result['successful_requests']/result['total_requests']) * 100,
-            'Total Requests': result['total_requests'],
-            'Successful Requests': result['successful_requests'],
-            'Failed Requests': result['failed_requests'],
-            'Total Time (s)': result['total_time']
-        })
-    return pd.DataFrame(data)
+    df = pd.json_normalize(results)
+    df['Environment'] = env_name
+    df['Model'] = df['model'].str.rsplit('/', n=1).str[-1]
+    df['Success Rate %'] = df['successful_requests'] / df['total_requests'] * 100
+    df = df.rename(columns=RESULT_COLUMNS)[COMPARISON_COLUMNS]
+
+    # Low-cardinality labels as categoricals (in order of appearance) keep
+    # the Arrow payloads sent to the browser small
+    for col in ['Environment', 'Model', 'Full Model Name']:
+        df[col] = pd.Categorical(df[col], categories=df[col].unique())
+    return df
 
 # Display benchmark type info
 st.info(f"📊 Displaying: **{results_label}** results")
@@ -108,17 +145,15 @@ df_managed = create_comparison_df(managed_results, "Managed") if managed_exists
 df_combined = pd.concat([df_baseline, df_managed], ignore_index=True)
 
 # === SINGLE ENVIRONMENT VIEW ===
-if view_mode == "Single Environment":
-    available_envs = []
-    if baseline_exists:
-        available_envs.append("Baseline")
-    if managed_exists:
-        available_envs.append("Managed")
+@st.fragment
+def render_single_environment(dfs_by_env):
+    """Render one environment's results
 
-    selected_env = st.sidebar.selectbox("Select Environment", available_envs)
-
-    df_selected = df_baseline if selected_env == "Baseline" else df_managed
-    results_selected = baseline_results if selected_env == "Baseline" else managed_results
+    Runs as a fragment, so switching the environment only reruns this panel
+    instead of reloading results and rebuilding every other chart.
+    """
+    selected_env = st.selectbox("Select Environment", list(dfs_by_env))
+    df_selected = dfs_by_env[selected_env]
 
     st.header(f"📊 {selected_env} Environment Results")
 
@@ -142,15 +177,24 @@ if view_mode == "Single Environment":
     # Charts
     col1, col2 = st.columns(2)
     with col1:
-        fig = px.bar(df_selected, x='Model', y='Requests/sec',
-                    title="Requests per Second", color='Model')
+        fig = bar_chart(df_selected, x='Model', y='Requests/sec',
+                        title="Requests per Second", color='Model')
         st.plotly_chart(fig, use_container_width=True)
 
     with col2:
-        fig = px.bar(df_selected, x='Model', y='Mean Latency (s)',
-                    title="Mean Latency", color='Model')
+        fig = bar_chart(df_selected, x='Model', y='Mean Latency (s)',
+                        title="Mean Latency", color='Model')
         st.plotly_chart(fig, use_container_width=True)
 
+if view_mode == "Single Environment":
+    dfs_by_env = {}
+    if baseline_exists:
+        dfs_by_env["Baseline"] = df_baseline
+    if managed_exists:
+        dfs_by_env["Managed"] = df_managed
+
+    render_single_environment(dfs_by_env)
+
 # === SIDE-BY-SIDE COMPARISON ===
 elif view_mode == "Side-by-Side Comparison":
     if not baseline_exists or not managed_exists:
@@ -167,65 +211,70 @@ elif view_mode == "Side-by-Side Comparison":
 
     st.header("🔀 Side-by-Side Environment Comparison")
 
-    # Overall comparison
+    # Overall comparison: one mean() per environment for all summary columns
+    summary_cols = ['Requests/sec', 'Mean Latency (s)', 'Tokens/sec']
+    baseline_avg = df_baseline[summary_cols].mean()
+    managed_avg = df_managed[summary_cols].mean()
+    change_pct = (managed_avg - baseline_avg) / baseline_avg * 100
+
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader("🔵 Baseline")
-        st.metric("Avg Requests/sec", f"{df_baseline['Requests/sec'].mean():.2f}")
-        st.metric("Avg Latency", f"{df_baseline['Mean Latency (s)'].mean():.2f}s")
-        st.metric("Avg Tokens/sec", f"{df_baseline['Tokens/sec'].mean():.0f}")
+        st.metric("Avg Requests/sec", f"{baseline_avg['Requests/sec']:.2f}")
+        st.metric("Avg Latency", f"{baseline_avg['Mean Latency (s)']:.2f}s")
+        st.metric("Avg Tokens/sec", f"{baseline_avg['Tokens/sec']:.0f}")
 
     with col2:
         st.subheader("🟢 Managed")
-        baseline_avg_rps = df_baseline['Requests/sec'].mean()
-        managed_avg_rps = df_managed['Requests/sec'].mean()
-        improvement_rps = ((managed_avg_rps - baseline_avg_rps) / baseline_avg_rps) * 100
-
-        baseline_avg_lat = df_baseline['Mean Latency (s)'].mean()
-        managed_avg_lat = df_managed['Mean Latency (s)'].mean()
-        improvement_lat = ((baseline_avg_lat - managed_avg_lat) / baseline_avg_lat) * 100
+        # Latency improves when it goes down
+        improvement_lat = ((baseline_avg['Mean Latency (s)'] - managed_avg['Mean Latency (s)'])
+                           / baseline_avg['Mean Latency (s)']) * 100
 
-        baseline_avg_tokens = df_baseline['Tokens/sec'].mean()
-        managed_avg_tokens = df_managed['Tokens/sec'].mean()
-        improvement_tokens = ((managed_avg_tokens - baseline_avg_tokens) / baseline_avg_tokens) * 100
-
-        st.metric("Avg Requests/sec", f"{managed_avg_rps:.2f}",
-                 delta=f"{improvement_rps:+.1f}%")
-        st.metric("Avg Latency", f"{managed_avg_lat:.2f}s",
+        st.metric("Avg Requests/sec", f"{managed_avg['Requests/sec']:.2f}",
+                 delta=f"{change_pct['Requests/sec']:+.1f}%")
+        st.metric("Avg Latency", f"{managed_avg['Mean Latency (s)']:.2f}s",
                  delta=f"{improvement_lat:+.1f}% (lower is better)",
                  delta_color="inverse")
-        st.metric("Avg Tokens/sec", f"{managed_avg_tokens:.0f}",
-                 delta=f"{improvement_tokens:+.1f}%")
+        st.metric("Avg Tokens/sec", f"{managed_avg['Tokens/sec']:.0f}",
+                 delta=f"{change_pct['Tokens/sec']:+.1f}%")
 
     # Per-model comparison table
     st.subheader("📋 Per-Model Comparison")
 
-    comparison_data = []
-    for model in df_baseline['Model'].unique():
-        baseline_row = df_baseline[df_baseline['Model'] == model].iloc[0]
-        managed_row = df_managed[df_managed['Model'] == model].iloc[0] if model in df_managed['Model'].values else None
-
-        if managed_row is not None:
-            rps_improvement = ((managed_row['Requests/sec'] - baseline_row['Requests/sec']) / baseline_row['Requests/sec']) * 100
-            lat_improvement = ((baseline_row['Mean Latency (s)'] - managed_row['Mean Latency (s)']) / baseline_row['Mean Latency (s)']) * 100
-            tokens_improvement = ((managed_row['Tokens/sec'] - baseline_row['Tokens/sec']) / baseline_row['Tokens/sec']) * 100
-
-            comparison_data.append({
-                'Model': model,
-                'Baseline Req/s': f"{baseline_row['Requests/sec']:.2f}",
-                'Managed Req/s': f"{managed_row['Requests/sec']:.2f}",
-                'Req/s Δ%': f"{rps_improvement:+.1f}%",
-                'Baseline Latency': f"{baseline_row['Mean Latency (s)']:.2f}s",
-                'Managed Latency': f"{managed_row['Mean Latency (s)']:.2f}s",
-                'Latency Δ%': f"{lat_improvement:+.1f}%",
-                'Baseline Tokens/s': f"{baseline_row['Tokens/sec']:.0f}",
-                'Managed Tokens/s': f"{managed_row['Tokens/sec']:.0f}",
-                'Tokens/s Δ%': f"{tokens_improvement:+.1f}%"
-            })
-
-    df_comparison_table = pd.DataFrame(comparison_data)
-    st.dataframe(df_comparison_table, use_container_width=True)
+    # Pair up each model's rows with one hash join, then compute deltas per column
+    cols = ['Model', 'Requests/sec', 'Mean Latency (s)', 'Tokens/sec']
+    merged = df_baseline[cols].merge(df_managed[cols], on='Model', suffixes=('_b', '_m'))
+    rps_b, rps_m = merged['Requests/sec_b'], merged['Requests/sec_m']
+    lat_b, lat_m = merged['Mean Latency (s)_b'], merged['Mean Latency (s)_m']
+    tok_b, tok_m = merged['Tokens/sec_b'], merged['Tokens/sec_m']
+
+    df_comparison_table = pd.DataFrame({
+        'Model': merged['Model'],
+        'Baseline Req/s': rps_b,
+        'Managed Req/s': rps_m,
+        'Req/s Δ%': (rps_m - rps_b) / rps_b * 100,
+        'Baseline Latency': lat_b,
+        'Managed Latency': lat_m,
+        'Latency Δ%': (lat_b - lat_m) / lat_b * 100,
+        'Baseline Tokens/s': tok_b,
+        'Managed Tokens/s': tok_m,
+        'Tokens/s Δ%': (tok_m - tok_b) / tok_b * 100,
+    })
+    st.dataframe(
+        df_comparison_table.style.format({
+            'Baseline Req/s': '{:.2f}',
+            'Managed Req/s': '{:.2f}',
+            'Req/s Δ%': '{:+.1f}%',
+            'Baseline Latency': '{:.2f}s',
+            'Managed Latency': '{:.2f}s',
+            'Latency Δ%': '{:+.1f}%',
+            'Baseline Tokens/s': '{:.0f}',
+            'Managed Tokens/s': '{:.0f}',
+            'Tokens/s Δ%': '{:+.1f}%',
+        }),
+        use_container_width=True
+    )
 
 # === OVERLAY COMPARISON ===
 elif view_mode == "Overlay Comparison":
@@ -236,89 +285,44 @@ elif view_mode == "Overlay Comparison":
 
     st.header("📊 Overlay Comparison Charts")
 
-    # Requests/sec comparison
-    fig_rps = go.Figure()
-    fig_rps.add_trace(go.Bar(
-        name='Baseline',
-        x=df_baseline['Model'],
-        y=df_baseline['Requests/sec'],
-        marker_color='lightblue'
-    ))
-    fig_rps.add_trace(go.Bar(
-        name='Managed',
-        x=df_managed['Model'],
-        y=df_managed['Requests/sec'],
-        marker_color='lightgreen'
-    ))
-    fig_rps.update_layout(
-        title='Requests per Second Comparison',
-        xaxis_title='Model',
-        yaxis_title='Requests/sec',
-        barmode='group'
+    # Requests/sec, latency and token throughput as facets of one grouped figure
+    df_overlay = pd.concat([
+        df_baseline.assign(Environment='Baseline'),
+        df_managed.assign(Environment='Managed'),
+    ]).melt(
+        id_vars=['Model', 'Environment'],
+        value_vars=['Requests/sec', 'Mean Latency (s)', 'Tokens/sec'],
+        var_name='Metric',
+        value_name='Value'
     )
-    st.plotly_chart(fig_rps, use_container_width=True)
-
-    # Latency comparison
-    col1, col2 = st.columns(2)
-
-    with col1:
-        fig_lat = go.Figure()
-        fig_lat.add_trace(go.Bar(
-            name='Baseline',
-            x=df_baseline['Model'],
-            y=df_baseline['Mean Latency (s)'],
-            marker_color='lightblue'
-        ))
-        fig_lat.add_trace(go.Bar(
-            name='Managed',
-            x=df_managed['Model'],
-            y=df_managed['Mean Latency (s)'],
-            marker_color='lightgreen'
-        ))
-        fig_lat.update_layout(
-            title='Mean Latency Comparison',
-            xaxis_title='Model',
-            yaxis_title='Latency (s)',
-            barmode='group'
-        )
-        st.plotly_chart(fig_lat, use_container_width=True)
-
-    with col2:
-        fig_tokens = go.Figure()
-        fig_tokens.add_trace(go.Bar(
-            name='Baseline',
-            x=df_baseline['Model'],
-            y=df_baseline['Tokens/sec'],
-            marker_color='lightblue'
-        ))
-        fig_tokens.add_trace(go.Bar(
-            name='Managed',
-            x=df_managed['Model'],
-            y=df_managed['Tokens/sec'],
-            marker_color='lightgreen'
-        ))
-        fig_tokens.update_layout(
-            title='Token Throughput Comparison',
-            xaxis_title='Model',
-            yaxis_title='Tokens/sec',
-            barmode='group'
-        )
-        st.plotly_chart(fig_tokens, use_container_width=True)
+    fig_overlay = bar_chart(
+        df_overlay,
+        x='Model',
+        y='Value',
+        color='Environment',
+        facet_col='Metric',
+        facet_col_wrap=1,
+        barmode='group',
+        color_discrete_map={'Baseline': 'lightblue', 'Managed': 'lightgreen'},
+        labels={'Value': ''},
+        height=900,
+        title='Throughput and Latency Comparison'
+    )
+    st.plotly_chart(fig_overlay, use_container_width=True)
 
     # Latency percentiles comparison
     st.subheader("Latency Percentiles Comparison")
 
-    percentile_data = []
-    for env, df in [("Baseline", df_baseline), ("Managed", df_managed)]:
-        for _, row in df.iterrows():
-            percentile_data.extend([
-                {'Environment': env, 'Model': row['Model'], 'Percentile': 'Mean', 'Latency (s)': row['Mean Latency (s)']},
-                {'Environment': env, 'Model': row['Model'], 'Percentile': 'P95', 'Latency (s)': row['P95 Latency (s)']},
-                {'Environment': env, 'Model': row['Model'], 'Percentile': 'P99', 'Latency (s)': row['P99 Latency (s)']},
-            ])
-
-    df_percentiles = pd.DataFrame(percentile_data)
-    fig_perc = px.bar(
+    df_percentiles = pd.concat([
+        df_baseline.assign(Environment='Baseline'),
+        df_managed.assign(Environment='Managed'),
+    ])[['Environment', 'Model', 'Mean Latency (s)', 'P95 Latency (s)', 'P99 Latency (s)']].melt(
+        id_vars=['Environment', 'Model'], var_name='Percentile', value_name='Latency (s)'
+    )
+    df_percentiles['Percentile'] = df_percentiles['Percentile'].map(
+        {'Mean Latency (s)': 'Mean', 'P95 Latency (s)': 'P95', 'P99 Latency (s)': 'P99'}
+    )
+    fig_perc = bar_chart(
         df_percentiles,
         x='Model',
         y='Latency (s)',
@@ -330,13 +334,33 @@ elif view_mode == "Overlay Comparison":
     st.plotly_chart(fig_perc, use_container_width=True)
 
 # Detailed results expander
+@st.fragment
+def render_raw_results(raw_by_env):
+    """Offer raw results as downloads; only ship the full JSON tree when asked
+
+    st.json sends the whole payload to the browser on every rerun, even with
+    the expander closed, so it sits behind a toggle in its own fragment.
+    """
+    show_json = st.checkbox("Show full JSON")
+    for env, results in raw_by_env.items():
+        st.subheader(f"{env} Results")
+        st.download_button(
+            f"Download {env} JSON",
+            data=(orjson.dumps(results, option=orjson.OPT_INDENT_2) if orjson is not None
+                  else json.dumps(results, indent=2)),
+            file_name=f"{env.lower()}-results.json",
+            mime="application/json"
+        )
+        if show_json:
+            st.json(results)
+
 with st.expander("🔍 View Detailed Raw Results"):
+    raw_by_env = {}
     if baseline_exists:
-        st.subheader("Baseline Results")
-        st.json(baseline_results)
+        raw_by_env["Baseline"] = baseline_results
     if managed_exists:
-        st.subheader("Managed Results")
-        st.json(managed_results)
+        raw_by_env["Managed"] = managed_results
+    render_raw_results(raw_by_env)
 
 # Infrastructure info
 st.sidebar.markdown("---")
@@ -2,18 +2,36 @@ import os
 import logging
 from typing import List, Dict, Optional
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
-from itertools import cycle
+import orjson
+from itertools import count
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# httpx logs every upstream request at INFO; keep it off the proxy path
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 app = FastAPI(title="Simple Round-Robin Load Balancer")
 
 # Configuration
 VLLM_ENDPOINTS = os.getenv("VLLM_ENDPOINTS", "").split(",")
 
+# Upstream URLs for every (endpoint, proxied path) pair, parsed once so the
+# proxy path does a single dict lookup instead of building and parsing a URL
+PROXY_PATHS = ("/v1/completions", "/v1/chat/completions")
+UPSTREAM_URLS = {
+    (endpoint, path): httpx.URL(f"{endpoint}{path}")
+    for endpoint in VLLM_ENDPOINTS
+    for path in PROXY_PATHS
+}
+
+# Client headers passed through to vLLM. Hop-by-hop headers (host,
+# content-length, connection, ...) are left to httpx so pooled connections
+# stay reusable.
+FORWARDED_HEADERS = frozenset({"authorization", "content-type", "accept", "x-request-id"})
+
 
 class RoundRobinSelector:
     """Simple round-robin selector for model replicas."""
@@ -28,28 +46,27 @@ class RoundRobinSelector:
             "mistralai/Mistral-7B-Instruct-v0.3": [endpoints[4], endpoints[5]],
         }
 
-        # Create round-robin iterators for each model
-        self.model_iterators = {
-            model: cycle(eps) for model, eps in self.model_endpoints.items()
+        # Per-model replica tuple and request counter; next() on an
+        # itertools.count is atomic under the GIL
+        self.model_replicas = {
+            model: (tuple(eps), count()) for model, eps in self.model_endpoints.items()
         }
 
         # Fallback: round-robin across all endpoints
-        self.global_iterator = cycle(endpoints)
+        self.global_counter = count()
 
     def get_next_endpoint(self, model: Optional[str] = None) -> str:
         """
         Get next endpoint using round-robin.
         If model is specified, cycle through that model's replicas.
         """
-        if model and model in self.model_iterators:
-            endpoint = next(self.model_iterators[model])
-            logger.info(f"Model {model}: Selected {endpoint} (round-robin)")
-            return endpoint
+        replicas = self.model_replicas.get(model)
+        if replicas is None:
+            # Fallback to global round-robin
+            return self.endpoints[next(self.global_counter) % len(self.endpoints)]
 
-        # Fallback to global round-robin
-        endpoint = next(self.global_iterator)
-        logger.info(f"No model specified: Selected {endpoint} (global round-robin)")
-        return endpoint
+        endpoints, counter = replicas
+        return endpoints[next(counter) % len(endpoints)]
 
 
 selector = RoundRobinSelector(VLLM_ENDPOINTS)
@@ -57,10 +74,26 @@ selector = RoundRobinSelector(VLLM_ENDPOINTS)
 
 @app.on_event("startup")
 async def startup_event():
-    """Startup message."""
+    """Create the shared backend client and log the endpoints."""
+    # One pooled client for the process so connections to the vLLM replicas
+    # are kept alive and reused instead of re-established per request
+    app.state.client = httpx.AsyncClient(
+        timeout=httpx.Timeout(300.0, connect=5.0),
+        limits=httpx.Limits(
+            max_connections=200,
+            max_keepalive_connections=100,
+            keepalive_expiry=30.0,
+        ),
+    )
     logger.info(f"Simple Round-Robin LB started with endpoints: {VLLM_ENDPOINTS}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the shared backend client."""
+    await app.state.client.aclose()
+
+
 @app.get("/health")
 async def health():
     """Health check endpoint."""
@@ -72,42 +105,44 @@ async def health():
 async def proxy_request(request: Request):
     """Proxy requests using round-robin selection."""
     try:
-        # Parse request body
-        body = await request.json()
+        # Parse request body; the raw bytes are forwarded as-is, so the body
+        # is never re-serialized
+        raw_body = await request.body()
+        body = orjson.loads(raw_body)
         model = body.get("model")
 
         # Select endpoint via round-robin
         endpoint = selector.get_next_endpoint(model)
 
-        # Forward request with clean headers
-        headers = {
-            "Content-Type": "application/json",
-        }
+        # Forward request with only the whitelisted client headers
+        headers = {k: v for k, v in request.headers.items() if k in FORWARDED_HEADERS}
+        headers.setdefault("content-type", "application/json")
+
+        client = request.app.state.client
+        url = UPSTREAM_URLS[(endpoint, request.url.path)]
 
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(
-                f"{endpoint}{request.url.path}",
-                json=body,
-                headers=headers
+        # Handle streaming responses: forward chunks as vLLM emits them
+        # instead of buffering the whole body first
+        if body.get("stream", False):
+            upstream = await client.send(
+                client.build_request("POST", url, content=raw_body, headers=headers),
+                stream=True
             )
+            return StreamingResponse(
+                upstream.aiter_bytes(),
+                media_type=upstream.headers.get("content-type"),
+                status_code=upstream.status_code,
+                background=BackgroundTask(upstream.aclose)
+            )
+
+        response = await client.post(url, content=raw_body, headers=headers)
 
-            # Handle streaming responses
-            if body.get("stream", False):
-                async def stream_response():
-                    async for chunk in response.aiter_bytes():
-                        yield chunk
-
-                return StreamingResponse(
-                    stream_response(),
-                    media_type=response.headers.get("content-type"),
-                    status_code=response.status_code
-                )
-            else:
-                # Return JSON response directly
-                return JSONResponse(
-                    content=response.json(),
-                    status_code=response.status_code
-                )
+        # Upstream already returned JSON; pass the bytes through untouched
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type", "application/json")
+        )
 
     except Exception as e:
         logger.error(f"Error proxying request: {e}")
@@ -127,4 +162,13 @@ async def list_models():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Single worker on purpose: round-robin counters are per process, so
+    # multiple workers would break the strict replica alternation
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+    )
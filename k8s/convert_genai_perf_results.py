@@ -5,77 +5,66 @@ Reads GenAI-Perf JSON/CSV results and converts to the format expected by the das
 """
 
 import json
-import csv
 import sys
 import os
 from pathlib import Path
 import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# GenAI-Perf CSV column name variations, in order of preference
+LATENCY_COLUMNS = ('request_latency_ms', 'end_to_end_latency_ms', 'latency_ms')
+TOKEN_COLUMNS = ('output_token_count', 'num_output_tokens', 'output_tokens')
 
 def parse_genai_perf_csv(csv_file):
     """Parse GenAI-Perf profile_export.csv file"""
     if not os.path.exists(csv_file):
         return None
 
-    with open(csv_file, 'r') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+    # Only the latency/token columns are parsed
+    wanted = set(LATENCY_COLUMNS + TOKEN_COLUMNS)
+    try:
+        df = pd.read_csv(csv_file, usecols=lambda col: col in wanted)
+    except pd.errors.EmptyDataError:
+        return None
 
-    if not rows:
+    latency_col = next((col for col in LATENCY_COLUMNS if col in df.columns), None)
+    token_col = next((col for col in TOKEN_COLUMNS if col in df.columns), None)
+
+    if latency_col is None:
         return None
 
-    # Extract metrics from CSV
-    # GenAI-Perf CSV typically has columns like:
-    # request_latency_ms, time_to_first_token_ms, inter_token_latency_ms, output_token_count, etc.
-
-    latencies = []
-    output_tokens = []
-
-    for row in rows:
-        # Try different column name variations
-        latency_col = None
-        for col_name in ['request_latency_ms', 'end_to_end_latency_ms', 'latency_ms']:
-            if col_name in row:
-                latency_col = col_name
-                break
-
-        if latency_col and row[latency_col]:
-            try:
-                # Convert ms to seconds
-                latencies.append(float(row[latency_col]) / 1000.0)
-            except ValueError:
-                continue
-
-        # Extract output tokens
-        token_col = None
-        for col_name in ['output_token_count', 'num_output_tokens', 'output_tokens']:
-            if col_name in row:
-                token_col = col_name
-                break
-
-        if token_col and row[token_col]:
-            try:
-                output_tokens.append(int(float(row[token_col])))
-            except ValueError:
-                continue
-
-    if not latencies:
+    # Convert ms to seconds, skipping empty or non-numeric cells
+    latencies = pd.to_numeric(df[latency_col], errors='coerce').dropna().to_numpy(dtype=np.float64) / 1000.0
+
+    if token_col:
+        output_tokens = pd.to_numeric(df[token_col], errors='coerce').dropna().to_numpy(dtype=np.float64).astype(np.int64)
+    else:
+        output_tokens = np.empty(0, dtype=np.int64)
+
+    if not latencies.size:
         return None
 
-    # Calculate statistics
-    latencies.sort()
+    # Calculate statistics (latencies are left in request order)
     n = len(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
 
     result = {
         'latencies': latencies,
         'output_tokens': output_tokens,
-        'mean_latency': sum(latencies) / n,
-        'median_latency': latencies[n // 2],
-        'min_latency': min(latencies),
-        'max_latency': max(latencies),
-        'p95_latency': latencies[int(n * 0.95)],
-        'p99_latency': latencies[int(n * 0.99)],
-        'total_tokens': sum(output_tokens) if output_tokens else 0,
-        'mean_tokens': sum(output_tokens) / len(output_tokens) if output_tokens else 0,
+        'mean_latency': float(latencies.mean()),
+        'median_latency': float(p50),
+        'min_latency': float(latencies.min()),
+        'max_latency': float(latencies.max()),
+        'p95_latency': float(p95),
+        'p99_latency': float(p99),
+        'total_tokens': int(output_tokens.sum()),
+        'mean_tokens': float(output_tokens.mean()) if output_tokens.size else 0,
         'num_requests': n
     }
 
@@ -135,11 +124,12 @@ def convert_results(genai_perf_dir, namespace="baseline"):
 
     all_results = []
 
-    # Scan for model result directories
-    for model_dir in genai_perf_path.iterdir():
-        if not model_dir.is_dir():
-            continue
+    # Scan for model result directories (scandir reports the entry type
+    # without a stat call per entry)
+    with os.scandir(genai_perf_path) as entries:
+        model_dirs = [Path(entry.path) for entry in entries if entry.is_dir()]
 
+    for model_dir in model_dirs:
         model_short_name = model_dir.name
         full_model_name = models.get(model_short_name)
 
@@ -243,9 +233,14 @@ def main():
     # Create output directory
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
-    # Save results
-    with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2)
+    # Save results (orjson when it is installed)
+    if orjson is not None:
+        output_file.write_bytes(
+            orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        )
+    else:
+        with open(output_file, 'w') as f:
+            json.dump(results, f, indent=2)
 
     print(f"\n{'='*60}")
     print(f"✅ Conversion complete!")